@@ -0,0 +1,91 @@
+"""Throughput benchmark for doubt_messages inserts.
+
+Compares one INSERT + COMMIT per message (the previous behaviour) with the
+group-commit MessageWriter at increasing concurrency. Runs against the
+database configured in .env and removes its scratch user afterwards.
+
+    python3 bench_message_writer.py [messages_per_worker]
+"""
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from server import connect_db, init_db, MessageWriter
+
+CONCURRENCY_LEVELS = [1, 4, 16, 64]
+
+
+def create_scratch_doubt():
+    conn = connect_db()
+    if conn is None:
+        raise SystemExit("Database connection failed")
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO users (email, password_hash) VALUES (%s, %s)",
+        (f"bench-{uuid.uuid4().hex}@example.invalid", "x"),
+    )
+    user_id = cursor.lastrowid
+    cursor.execute("INSERT INTO doubts (user_id, title) VALUES (%s, %s)", (user_id, "benchmark"))
+    doubt_id = cursor.lastrowid
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return user_id, doubt_id
+
+
+def drop_scratch_user(user_id):
+    conn = connect_db()
+    cursor = conn.cursor()
+    # Cascades to the scratch doubt and its messages
+    cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def per_row_commit_worker(doubt_id, count):
+    conn = connect_db()
+    cursor = conn.cursor()
+    for i in range(count):
+        cursor.execute(
+            "INSERT INTO doubt_messages (doubt_id, sender, message) VALUES (%s, %s, %s)",
+            (doubt_id, 'user', f"per-row {i}"),
+        )
+        conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def group_commit_worker(writer, doubt_id, count):
+    for i in range(count):
+        writer.write([(doubt_id, 'user', f"group {i}")])
+
+
+def run(label, concurrency, count, worker, *args):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(worker, *args, count) for _ in range(concurrency)]
+        for f in futures:
+            f.result()
+    elapsed = time.perf_counter() - start
+    total = concurrency * count
+    print(f"{label:<14} {concurrency:>11} {total:>9} {elapsed:>9.2f} {total / elapsed:>11.0f}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    init_db()
+    user_id, doubt_id = create_scratch_doubt()
+    writer = MessageWriter()
+    try:
+        print(f"{'mode':<14} {'concurrency':>11} {'messages':>9} {'seconds':>9} {'msgs/sec':>11}")
+        for concurrency in CONCURRENCY_LEVELS:
+            run("per-row", concurrency, count, per_row_commit_worker, doubt_id)
+            run("group-commit", concurrency, count, group_commit_worker, writer, doubt_id)
+    finally:
+        drop_scratch_user(user_id)
+
+
+if __name__ == "__main__":
+    main()
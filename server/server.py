@@ -1,12 +1,50 @@
 import os
+import decimal
+import queue
+import threading
+import time
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 import google.generativeai as genai
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
+from flask.json.provider import JSONProvider
 import mysql.connector
 from flask_cors import CORS
 import bcrypt
+import orjson
+
+# ------------------ JSON Serialization ------------------
+def _orjson_default(obj):
+    """Serialize MySQL column types that orjson does not handle natively."""
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.decode("utf-8", errors="replace")
+    if isinstance(obj, set):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps_json(obj):
+    """Encode obj to JSON bytes; naive MySQL datetimes are sent as UTC ISO 8601 strings."""
+    return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z)
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson, used by every jsonify() call."""
+
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        return dumps_json(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_json(obj), mimetype=self.mimetype)
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # Configure CORS
 CORS(app, resources={
@@ -35,8 +73,28 @@ DB_PASSWORD = os.getenv("DB_PASSWORD", "nithees")
 DB_NAME = os.getenv("DB_NAME", "student_career_db")
 DB_PORT = int(os.getenv("DB_PORT", "3306"))
 
+# Rows fetched per round-trip when streaming exports
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+
+# Precomputed field guidance: entries older than the TTL are regenerated.
+# The cache and its scheduler live in each process, so under a multi-worker
+# WSGI server every worker makes its own LLM calls per TTL and answers 503
+# until its own first pass completes.
+GUIDANCE_TTL_SECONDS = int(os.getenv("GUIDANCE_TTL_SECONDS", "86400"))
+GUIDANCE_CHECK_INTERVAL = int(os.getenv("GUIDANCE_CHECK_INTERVAL", "300"))
+
+# Group commit for doubt_messages: how long the writer waits to fill a batch
+# and the most rows per multi-row INSERT. A request waits up to
+# MESSAGE_WRITE_TIMEOUT for its batch to be picked up (then it is cancelled and
+# never written), and once its batch is being flushed, up to that long again
+# before giving up with CommitOutcomeUnknown. The writer's connection uses the
+# same value as its socket timeout, so a stalled server cannot wedge it.
+MESSAGE_BATCH_DELAY_MS = float(os.getenv("MESSAGE_BATCH_DELAY_MS", "5"))
+MESSAGE_BATCH_MAX_ROWS = int(os.getenv("MESSAGE_BATCH_MAX_ROWS", "200"))
+MESSAGE_WRITE_TIMEOUT = float(os.getenv("MESSAGE_WRITE_TIMEOUT", "10"))
+
 # Database connection function
-def connect_db():
+def connect_db(**options):
     """Establish a connection to the MySQL database."""
     try:
         return mysql.connector.connect(
@@ -44,7 +102,8 @@ def connect_db():
             user=DB_USER,
             password=DB_PASSWORD,
             database=DB_NAME,
-            port=DB_PORT
+            port=DB_PORT,
+            **options
         )
     except mysql.connector.Error as err:
         print("Database Error:", err)
@@ -134,6 +193,134 @@ def init_db():
         if conn:
             conn.close()
 
+# ------------------ Message Write Pipeline ------------------
+class CommitOutcomeUnknown(Exception):
+    """A message write may or may not have been committed; retrying could duplicate it."""
+
+class MessageWriter:
+    """Group-commit writer for doubt_messages.
+
+    Requests hand their rows to write(), which blocks until the batch holding
+    them is committed. A single background thread drains the queue, waiting
+    up to ``batch_delay_ms`` for concurrent writers to join, then stores each
+    batch with one multi-row INSERT and one COMMIT. If the INSERT fails, each
+    request in the batch is retried on its own so only the failing one sees an
+    error. If the COMMIT fails the batch may already be stored, so every request
+    in it gets CommitOutcomeUnknown instead of being re-inserted.
+    """
+
+    INSERT_SQL = "INSERT INTO doubt_messages (doubt_id, sender, message) VALUES (%s, %s, %s)"
+
+    def __init__(self, batch_delay_ms=MESSAGE_BATCH_DELAY_MS, max_rows=MESSAGE_BATCH_MAX_ROWS,
+                 timeout=MESSAGE_WRITE_TIMEOUT):
+        self.batch_delay = batch_delay_ms / 1000.0
+        self.max_rows = max_rows
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._thread = None
+        self._conn = None
+
+    def write(self, rows):
+        """Durably insert (doubt_id, sender, message) rows; returns once committed."""
+        rows = list(rows)
+        if not rows:
+            return
+        self._ensure_started()
+        pending = {"rows": rows, "state": "queued", "done": threading.Event(), "error": None}
+        self._queue.put(pending)
+        if not pending["done"].wait(self.timeout):
+            with self._state_lock:
+                if pending["state"] == "queued":
+                    # Never picked up: cancel it so a later flush cannot commit it
+                    pending["state"] = "cancelled"
+                    raise TimeoutError("Timed out waiting for message write to commit")
+            # Already being flushed; wait for the real outcome, but not forever
+            if not pending["done"].wait(self.timeout):
+                raise CommitOutcomeUnknown("Message write did not finish; it may or may not be saved")
+        if pending["error"] is not None:
+            raise pending["error"]
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        """Block for the first request, then gather others until the delay or row cap is hit."""
+        batch = [self._queue.get()]
+        count = len(batch[0]["rows"])
+        deadline = time.monotonic() + self.batch_delay
+        while count < self.max_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            count += len(item["rows"])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            with self._state_lock:
+                batch = [item for item in batch if item["state"] == "queued"]
+                for item in batch:
+                    item["state"] = "flushing"
+            if not batch:
+                continue
+            try:
+                self._flush([row for item in batch for row in item["rows"]])
+            except CommitOutcomeUnknown as e:
+                self._reset()
+                for item in batch:
+                    item["error"] = e
+            except Exception:
+                # Reconnect, then retry each request alone so one bad row
+                # (or a dropped connection) only fails the request that owns it
+                self._reset()
+                for item in batch:
+                    try:
+                        self._flush(item["rows"])
+                    except Exception as e:
+                        item["error"] = e
+                        self._reset()
+            for item in batch:
+                item["state"] = "done"
+                item["done"].set()
+
+    def _flush(self, rows):
+        if self._conn is None:
+            self._conn = connect_db(connection_timeout=max(1, int(self.timeout)))
+            if self._conn is None:
+                raise RuntimeError("Database connection failed")
+        cursor = self._conn.cursor()
+        try:
+            # executemany rewrites a simple INSERT ... VALUES into one multi-row INSERT
+            cursor.executemany(self.INSERT_SQL, rows)
+            try:
+                self._conn.commit()
+            except Exception as e:
+                raise CommitOutcomeUnknown(f"Commit failed, message write may or may not be saved: {e}") from e
+        finally:
+            cursor.close()
+
+    def _reset(self):
+        try:
+            if self._conn is not None:
+                self._conn.rollback()
+                self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+message_writer = MessageWriter()
+
 # ------------------ Authentication Routes ------------------
 @app.route("/register", methods=["POST"])
 def register():
@@ -402,6 +589,9 @@ def doubts():
                 "INSERT INTO doubt_messages (doubt_id, sender, message) VALUES (%s, %s, %s)",
                 (doubt_id, 'user', question)
             )
+            # Commit the doubt and its question together before the slow AI call,
+            # so the message writer's connection can reference the doubt
+            conn.commit()
             # Auto-generate an initial AI response for the created doubt
             try:
                 cursor_dict = conn.cursor(dictionary=True)
@@ -419,7 +609,7 @@ def doubts():
 
                 # Fetch the current thread (includes the initial question)
                 cursor_dict.execute(
-                    "SELECT sender, message FROM doubt_messages WHERE doubt_id = %s ORDER BY created_at ASC",
+                    "SELECT sender, message FROM doubt_messages WHERE doubt_id = %s ORDER BY created_at ASC, id ASC",
                     (doubt_id,),
                 )
                 msgs = cursor_dict.fetchall() or []
@@ -441,20 +631,16 @@ Response rules:
                 chat = model.start_chat(history=[])
                 ai_response = chat.send_message(prompt)
                 ai_text = (ai_response.text or "").strip()
-                if ai_text:
-                    cursor.execute(
-                        "INSERT INTO doubt_messages (doubt_id, sender, message) VALUES (%s, %s, %s)",
-                        (doubt_id, 'bot', ai_text),
-                    )
             except Exception as _e:
                 # Persist the AI error as a bot message to inform the user
-                err_text = f"AI error: {str(_e)}"
-                cursor.execute(
-                    "INSERT INTO doubt_messages (doubt_id, sender, message) VALUES (%s, %s, %s)",
-                    (doubt_id, 'bot', err_text),
-                )
+                ai_text = f"AI error: {str(_e)}"
+            if ai_text:
+                try:
+                    message_writer.write([(doubt_id, 'bot', ai_text)])
+                except Exception as _e:
+                    # The doubt is already saved; failing here would invite a duplicate on retry
+                    print("[doubts] Failed to store AI reply:", str(_e))
 
-            conn.commit()
             return jsonify({"success": True, "doubt_id": doubt_id}), 201
         except Exception as e:
             return jsonify({"error": str(e)}), 500
@@ -503,6 +689,104 @@ Response rules:
         if 'conn' in locals(): conn.close()
 
 
+@app.route("/api/doubts/export", methods=["GET"])
+def export_doubts():
+    """Stream a user's full doubt history as NDJSON.
+
+    Emits one ``{"type": "doubt", ...}`` line per doubt followed by one
+    ``{"type": "message", ...}`` line per message in that thread. Rows are
+    read from an unbuffered cursor in batches, so memory stays constant
+    regardless of history size.
+
+    A complete export ends with a ``{"type": "end", "doubts": <count>}`` line.
+    If the database fails mid-stream, a ``{"type": "error", ...}`` line is sent
+    instead and the stream stops; since the status is already 200, a missing
+    end line is how clients detect a truncated export.
+    """
+    user_id = request.args.get("user_id", type=int)
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+    conn = connect_db()
+    if conn is None:
+        return jsonify({"error": "Database connection failed"}), 500
+
+    state = {"cursor": None, "closed": False}
+
+    def close_export():
+        # Runs from the generator and from the response close hook; the latter
+        # covers HEAD requests and responses closed before iteration starts
+        if state["closed"]:
+            return
+        state["closed"] = True
+        try:
+            if state["cursor"]:
+                state["cursor"].close()
+        except mysql.connector.Error:
+            # Unread rows remain if the client disconnected mid-stream
+            pass
+        conn.close()
+
+    def generate():
+        try:
+            cursor = state["cursor"] = conn.cursor(dictionary=True, buffered=False)
+            cursor.execute(
+                """
+                SELECT d.id AS doubt_id, d.title, d.status, d.resolution_notes,
+                       d.created_at AS doubt_created_at, d.updated_at AS doubt_updated_at,
+                       m.id AS message_id, m.sender, m.message, m.created_at
+                FROM doubts d
+                LEFT JOIN doubt_messages m ON m.doubt_id = d.id
+                WHERE d.user_id = %s
+                ORDER BY d.id ASC, m.created_at ASC, m.id ASC
+                """,
+                (user_id,),
+            )
+            current_doubt = None
+            doubt_count = 0
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                chunk = []
+                for row in rows:
+                    if row["doubt_id"] != current_doubt:
+                        current_doubt = row["doubt_id"]
+                        doubt_count += 1
+                        chunk.append(dumps_json({
+                            "type": "doubt",
+                            "id": row["doubt_id"],
+                            "title": row["title"],
+                            "status": row["status"],
+                            "resolution_notes": row["resolution_notes"],
+                            "created_at": row["doubt_created_at"],
+                            "updated_at": row["doubt_updated_at"],
+                        }))
+                    if row["message_id"] is not None:
+                        chunk.append(dumps_json({
+                            "type": "message",
+                            "id": row["message_id"],
+                            "doubt_id": row["doubt_id"],
+                            "sender": row["sender"],
+                            "message": row["message"],
+                            "created_at": row["created_at"],
+                        }))
+                if chunk:
+                    yield b"\n".join(chunk) + b"\n"
+            yield dumps_json({"type": "end", "doubts": doubt_count}) + b"\n"
+        except Exception as e:
+            yield dumps_json({"type": "error", "error": str(e)}) + b"\n"
+        finally:
+            close_export()
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename=doubts_{user_id}.ndjson"},
+    )
+    response.call_on_close(close_export)
+    return response
+
+
 @app.route("/api/doubts/<int:doubt_id>", methods=["GET"])
 def get_doubt(doubt_id: int):
     """Get a single doubt with its message thread."""
@@ -526,7 +810,7 @@ def get_doubt(doubt_id: int):
             return jsonify({"error": "Forbidden"}), 403
 
         cursor.execute(
-            "SELECT id, sender, message, created_at FROM doubt_messages WHERE doubt_id = %s ORDER BY created_at ASC",
+            "SELECT id, sender, message, created_at FROM doubt_messages WHERE doubt_id = %s ORDER BY created_at ASC, id ASC",
             (doubt_id,),
         )
         messages = cursor.fetchall()
@@ -566,12 +850,8 @@ def reply_doubt(doubt_id: int):
         if int(doubt["user_id"]) != int(user_id):
             return jsonify({"error": "Forbidden"}), 403
 
-        # Insert the user's message
-        cursor2 = conn.cursor()
-        cursor2.execute(
-            "INSERT INTO doubt_messages (doubt_id, sender, message) VALUES (%s, %s, %s)",
-            (doubt_id, 'user', message),
-        )
+        # The user's message and any AI reply are written together in one batch
+        rows = [(doubt_id, 'user', message)]
 
         ai_response_text = None
         if use_ai:
@@ -587,18 +867,19 @@ def reply_doubt(doubt_id: int):
             )
             user_data = cursor.fetchone() or {}
 
-            # Get recent messages for context (last 10)
+            # Get recent messages for context (last 10, including the new one)
             cursor.execute(
                 """
                 SELECT sender, message FROM doubt_messages
                 WHERE doubt_id = %s
-                ORDER BY created_at DESC
-                LIMIT 10
+                ORDER BY created_at DESC, id DESC
+                LIMIT 9
                 """,
                 (doubt_id,),
             )
             recent = cursor.fetchall() or []
             recent.reverse()
+            recent.append({"sender": "user", "message": message})
 
             recent_str = "\n".join([f"{m['sender']}: {m['message']}" for m in recent])
             prompt = f"""
@@ -630,23 +911,18 @@ Response rules:
                 chat = model.start_chat(history=[])
                 ai_response = chat.send_message(prompt)
                 ai_response_text = (ai_response.text or "").strip()
-                if ai_response_text:
-                    cursor2.execute(
-                        "INSERT INTO doubt_messages (doubt_id, sender, message) VALUES (%s, %s, %s)",
-                        (doubt_id, 'bot', ai_response_text),
-                    )
             except Exception as e:
                 ai_response_text = f"AI error: {str(e)}"
-                cursor2.execute(
-                    "INSERT INTO doubt_messages (doubt_id, sender, message) VALUES (%s, %s, %s)",
-                    (doubt_id, 'bot', ai_response_text),
-                )
+            if ai_response_text:
+                rows.append((doubt_id, 'bot', ai_response_text))
 
+        message_writer.write(rows)
+        # End this connection's read snapshot so the thread below includes the new rows
         conn.commit()
 
         # Return updated messages
         cursor.execute(
-            "SELECT id, sender, message, created_at FROM doubt_messages WHERE doubt_id = %s ORDER BY created_at ASC",
+            "SELECT id, sender, message, created_at FROM doubt_messages WHERE doubt_id = %s ORDER BY created_at ASC, id ASC",
             (doubt_id,),
         )
         messages = cursor.fetchall()
@@ -655,7 +931,6 @@ Response rules:
         return jsonify({"error": str(e)}), 500
     finally:
         if 'cursor' in locals(): cursor.close()
-        if 'cursor2' in locals(): cursor2.close()
         if 'conn' in locals(): conn.close()
 
 
@@ -696,7 +971,119 @@ def resolve_doubt(doubt_id: int):
         if 'cursor' in locals(): cursor.close()
         if 'cursor2' in locals(): cursor2.close()
         if 'conn' in locals(): conn.close()
-  
+
+# ------------------ Precomputed Field Guidance ------------------
+# Fields match the static pages in client/html; qualification buckets cover
+# the most common entry points students arrive from.
+GUIDANCE_FIELDS = {
+    "engineering": "Engineering",
+    "doctor": "Medicine",
+    "law": "Law",
+    "commerce": "Commerce",
+}
+QUALIFICATION_BUCKETS = {
+    "school": "High school (10th/12th)",
+    "undergraduate": "Undergraduate degree",
+    "postgraduate": "Postgraduate degree",
+}
+GUIDANCE_QUESTIONS = [
+    "Which career paths and specializations are available?",
+    "What entrance exams, courses or certifications should I target next?",
+    "Which skills should I build first, and how?",
+    "What are typical roles, salaries and growth prospects?",
+]
+
+_guidance_cache = {}
+_guidance_lock = threading.Lock()
+_guidance_thread = None
+_guidance_start_lock = threading.Lock()
+
+def generate_guidance(field, bucket):
+    """Generate canonical guidance for a field and qualification bucket using Gemini AI"""
+    questions = "\n".join(f"- {q}" for q in GUIDANCE_QUESTIONS)
+    prompt = f"""
+You are an expert career counsellor for students.
+
+Field: {GUIDANCE_FIELDS[field]}
+Current Qualification: {QUALIFICATION_BUCKETS[bucket]}
+
+Answer each of these common questions for this student:
+{questions}
+
+Response rules:
+- Output strictly in Markdown, with one heading per question.
+- Keep each answer under 100 words.
+- Be professional, practical and encouraging.
+"""
+    chat = model.start_chat(history=[])
+    response = chat.send_message(prompt)
+    return (response.text or "").strip()
+
+def refresh_guidance():
+    """Regenerate every missing or stale guidance entry; keeps the old entry on failure."""
+    for field in GUIDANCE_FIELDS:
+        for bucket in QUALIFICATION_BUCKETS:
+            with _guidance_lock:
+                entry = _guidance_cache.get((field, bucket))
+            if entry and time.monotonic() - entry["refreshed"] < GUIDANCE_TTL_SECONDS:
+                continue
+            try:
+                text = generate_guidance(field, bucket)
+            except Exception as e:
+                print(f"[guidance] Error refreshing {field}/{bucket}:", str(e))
+                continue
+            if not text:
+                continue
+            with _guidance_lock:
+                _guidance_cache[(field, bucket)] = {
+                    "guidance": text,
+                    "generated_at": datetime.now(timezone.utc),
+                    "refreshed": time.monotonic(),
+                }
+
+def _guidance_worker():
+    while True:
+        refresh_guidance()
+        time.sleep(GUIDANCE_CHECK_INTERVAL)
+
+def start_guidance_scheduler():
+    """Start the background thread that keeps field guidance fresh (idempotent)."""
+    global _guidance_thread
+    with _guidance_start_lock:
+        if _guidance_thread is not None and _guidance_thread.is_alive():
+            return
+        _guidance_thread = threading.Thread(target=_guidance_worker, name="guidance-refresh", daemon=True)
+        _guidance_thread.start()
+
+@app.route("/api/guidance/<field>", methods=["GET"])
+def get_guidance(field):
+    """Serve precomputed guidance for a field, optionally for one qualification bucket."""
+    # Start the scheduler on first use so WSGI servers and `flask run` get it too
+    start_guidance_scheduler()
+    field = field.lower()
+    if field not in GUIDANCE_FIELDS:
+        return jsonify({"error": "Unknown field"}), 404
+    qualification = request.args.get("qualification")
+    if qualification and qualification not in QUALIFICATION_BUCKETS:
+        return jsonify({"error": "Unknown qualification"}), 400
+
+    buckets = [qualification] if qualification else list(QUALIFICATION_BUCKETS)
+    with _guidance_lock:
+        entries = {b: _guidance_cache.get((field, b)) for b in buckets}
+
+    guidance = [
+        {
+            "qualification": b,
+            "label": QUALIFICATION_BUCKETS[b],
+            "guidance": entry["guidance"],
+            "generated_at": entry["generated_at"],
+        }
+        for b, entry in entries.items() if entry
+    ]
+    if not guidance:
+        return jsonify({"error": "Guidance is being prepared, please try again shortly"}), 503
+    return jsonify({"field": field, "name": GUIDANCE_FIELDS[field], "guidance": guidance})
+
 # ------------------ Helper Functions ------------------
 def analyze_career_path(student_data):
     """Generate career advice using Gemini AI"""
@@ -717,4 +1104,9 @@ if __name__ == "__main__":
 
     # Debug flag can be toggled via environment variable
     debug_flag = os.getenv("FLASK_DEBUG", "true").lower() == "true"
+
+    # Precompute field guidance in the background; under the debug reloader
+    # only the serving child process should run the scheduler
+    if not debug_flag or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_guidance_scheduler()
     app.run(debug=debug_flag)
\ No newline at end of file
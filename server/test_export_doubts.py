@@ -0,0 +1,123 @@
+"""Tests for the NDJSON doubt export, using a stubbed connect_db."""
+import os
+from datetime import datetime
+
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+import orjson
+import pytest
+
+import server
+
+T = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def doubt_row(doubt_id, message_id=None, message=None):
+    return {
+        "doubt_id": doubt_id, "title": f"doubt {doubt_id}", "status": "open",
+        "resolution_notes": None, "doubt_created_at": T, "doubt_updated_at": T,
+        "message_id": message_id, "sender": "user" if message_id else None,
+        "message": message, "created_at": T if message_id else None,
+    }
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.position = 0
+
+    def execute(self, sql, params):
+        self.conn.params = params
+
+    def fetchmany(self, size):
+        if self.conn.fail_after is not None and self.position >= self.conn.fail_after:
+            raise RuntimeError("Lost connection to MySQL server")
+        self.conn.fetches.append(size)
+        rows = self.conn.rows[self.position:self.position + size]
+        self.position += size
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, rows, fail_after=None):
+        self.rows = rows
+        self.fail_after = fail_after
+        self.fetches = []
+        self.params = None
+        self.closed = False
+
+    def cursor(self, **kwargs):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def client():
+    return server.app.test_client()
+
+
+def export(client, monkeypatch, conn, batch_size=2):
+    monkeypatch.setattr(server, "connect_db", lambda: conn)
+    monkeypatch.setattr(server, "EXPORT_BATCH_SIZE", batch_size)
+    response = client.get("/api/doubts/export?user_id=7")
+    lines = [orjson.loads(line) for line in response.get_data().splitlines()]
+    response.close()
+    return response, lines
+
+
+def test_groups_messages_under_their_doubt_across_batches(client, monkeypatch):
+    conn = FakeConnection([
+        doubt_row(1, 10, "first"),
+        doubt_row(1, 11, "second"),
+        doubt_row(1, 12, "third"),
+        doubt_row(2),
+        doubt_row(3, 30, "only"),
+    ])
+
+    response, lines = export(client, monkeypatch, conn)
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert conn.params == (7,)
+    assert len(conn.fetches) > 2
+    assert [(line["type"], line.get("id")) for line in lines] == [
+        ("doubt", 1), ("message", 10), ("message", 11), ("message", 12),
+        ("doubt", 2),
+        ("doubt", 3), ("message", 30),
+        ("end", None),
+    ]
+    assert lines[0]["created_at"] == "2024-01-01T12:00:00Z"
+    assert lines[-1]["doubts"] == 3
+    assert conn.closed
+
+
+def test_database_error_ends_stream_without_end_line(client, monkeypatch):
+    conn = FakeConnection([doubt_row(1, 10, "a"), doubt_row(1, 11, "b"), doubt_row(2)], fail_after=2)
+
+    response, lines = export(client, monkeypatch, conn)
+
+    assert [line["type"] for line in lines] == ["doubt", "message", "message", "error"]
+    assert conn.closed
+
+
+def test_connection_closed_when_body_is_never_read(client, monkeypatch):
+    conn = FakeConnection([doubt_row(1, 10, "a")])
+    monkeypatch.setattr(server, "connect_db", lambda: conn)
+
+    response = client.head("/api/doubts/export?user_id=7")
+    response.close()
+
+    assert conn.closed
+
+
+def test_missing_user_id_is_unauthorized(client, monkeypatch):
+    monkeypatch.setattr(server, "connect_db", lambda: pytest.fail("should not connect"))
+
+    response = client.get("/api/doubts/export")
+
+    assert response.status_code == 401
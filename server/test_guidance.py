@@ -0,0 +1,95 @@
+"""Tests for precomputed field guidance, with server.model stubbed out."""
+import os
+
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+import pytest
+
+import server
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """Replaces the Gemini model; reply() decides each answer or raises."""
+
+    def __init__(self):
+        self.calls = 0
+        self.reply = lambda: "Guidance"
+
+    def start_chat(self, history):
+        return self
+
+    def send_message(self, prompt):
+        self.calls += 1
+        return FakeResponse(self.reply())
+
+
+@pytest.fixture
+def model(monkeypatch):
+    fake = FakeModel()
+    monkeypatch.setattr(server, "model", fake)
+    monkeypatch.setattr(server, "_guidance_cache", {})
+    monkeypatch.setattr(server, "start_guidance_scheduler", lambda: None)
+    return fake
+
+
+ENTRIES = len(server.GUIDANCE_FIELDS) * len(server.QUALIFICATION_BUCKETS)
+
+
+def test_fresh_entries_are_skipped_and_stale_ones_regenerated(model, monkeypatch):
+    monkeypatch.setattr(server, "GUIDANCE_TTL_SECONDS", 3600)
+    server.refresh_guidance()
+    assert model.calls == ENTRIES
+
+    server.refresh_guidance()
+    assert model.calls == ENTRIES
+
+    monkeypatch.setattr(server, "GUIDANCE_TTL_SECONDS", 0)
+    model.reply = lambda: "Updated"
+    server.refresh_guidance()
+    assert model.calls == 2 * ENTRIES
+    assert server._guidance_cache[("law", "school")]["guidance"] == "Updated"
+
+
+@pytest.mark.parametrize("reply", ["", RuntimeError("quota exceeded")])
+def test_old_entry_kept_when_regeneration_fails(model, monkeypatch, reply):
+    server.refresh_guidance()
+    before = dict(server._guidance_cache)
+
+    def failing():
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    monkeypatch.setattr(server, "GUIDANCE_TTL_SECONDS", 0)
+    model.reply = failing
+    server.refresh_guidance()
+
+    assert server._guidance_cache == before
+
+
+def test_endpoint_serves_cached_guidance(model):
+    server.refresh_guidance()
+    client = server.app.test_client()
+
+    response = client.get("/api/guidance/Engineering?qualification=school")
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["field"] == "engineering"
+    assert [g["qualification"] for g in body["guidance"]] == ["school"]
+    assert body["guidance"][0]["guidance"] == "Guidance"
+    assert body["guidance"][0]["generated_at"].endswith("Z")
+
+
+def test_endpoint_errors(model):
+    client = server.app.test_client()
+
+    assert client.get("/api/guidance/astronomy").status_code == 404
+    assert client.get("/api/guidance/law?qualification=phd").status_code == 400
+    assert client.get("/api/guidance/law").status_code == 503
+    assert model.calls == 0
@@ -0,0 +1,28 @@
+"""Tests for the orjson-backed JSON provider."""
+import decimal
+import os
+from datetime import datetime
+
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+import orjson
+
+import server
+from server import app, dumps_json
+
+
+def test_naive_datetime_is_sent_as_utc():
+    assert dumps_json({"t": datetime(2024, 1, 1, 12, 0, 0)}) == b'{"t":"2024-01-01T12:00:00Z"}'
+
+
+def test_decimal_and_bytes_are_encoded_as_strings():
+    data = orjson.loads(dumps_json({"salary": decimal.Decimal("1.50"), "raw": b"abc"}))
+    assert data == {"salary": "1.50", "raw": "abc"}
+
+
+def test_jsonify_uses_orjson_provider():
+    assert isinstance(app.json, server.OrjsonProvider)
+    with app.test_request_context():
+        response = server.jsonify({"updated_at": datetime(2024, 1, 1, 12, 0, 0)})
+    assert response.mimetype == "application/json"
+    assert response.get_json() == {"updated_at": "2024-01-01T12:00:00Z"}
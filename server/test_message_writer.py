@@ -0,0 +1,191 @@
+"""Tests for the group-commit MessageWriter, using a stubbed connect_db."""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+import server
+from server import CommitOutcomeUnknown, MessageWriter
+
+TEXT_LIMIT = 65535
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def executemany(self, sql, rows):
+        self.conn.db.before_execute(rows)
+        if self.conn.broken:
+            raise RuntimeError("Lost connection to MySQL server")
+        for row in rows:
+            if len(row[2].encode("utf-8")) > TEXT_LIMIT:
+                raise RuntimeError("Data too long for column 'message'")
+        self.conn.staged.extend(rows)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, db, broken=False):
+        self.db = db
+        self.broken = broken
+        self.staged = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        with self.db.lock:
+            self.db.rows.extend(self.staged)
+            self.db.commits += 1
+        self.staged = []
+        if self.db.lose_connection_on_commit:
+            # The server applied the commit but the client never saw the ack
+            self.db.lose_connection_on_commit = False
+            raise RuntimeError("Lost connection to MySQL server during query")
+
+    def rollback(self):
+        self.staged = []
+
+    def close(self):
+        pass
+
+
+class FakeDatabase:
+    """Stands in for MySQL: records committed rows and counts commits."""
+
+    def __init__(self, broken_connections=0):
+        self.lock = threading.Lock()
+        self.rows = []
+        self.commits = 0
+        self.connections = 0
+        self.broken_connections = broken_connections
+        self.lose_connection_on_commit = False
+        self.connect_options = None
+        self.before_execute = lambda rows: None
+
+    def connect(self, **options):
+        self.connect_options = options
+        self.connections += 1
+        return FakeConnection(self, broken=self.connections <= self.broken_connections)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDatabase()
+    monkeypatch.setattr(server, "connect_db", fake.connect)
+    return fake
+
+
+def write_concurrently(writer, batches):
+    """Submit every batch from its own thread; return the exception (or None) per batch."""
+    def attempt(rows):
+        try:
+            writer.write(rows)
+        except Exception as e:
+            return e
+        return None
+
+    with ThreadPoolExecutor(max_workers=len(batches)) as pool:
+        return list(pool.map(attempt, batches))
+
+
+def test_concurrent_writes_share_one_commit(db):
+    writer = MessageWriter(batch_delay_ms=200, timeout=5)
+    batches = [[(1, 'user', f"message {i}")] for i in range(8)]
+
+    errors = write_concurrently(writer, batches)
+
+    assert errors == [None] * 8
+    assert sorted(db.rows) == sorted(row for rows in batches for row in rows)
+    assert db.commits < len(batches)
+
+
+def test_failing_row_only_fails_its_own_request(db):
+    writer = MessageWriter(batch_delay_ms=200, timeout=5)
+    too_long = "x" * (TEXT_LIMIT + 1)
+    batches = [[(1, 'user', "first")], [(1, 'user', too_long)], [(1, 'bot', "second")]]
+
+    errors = write_concurrently(writer, batches)
+
+    assert errors[0] is None
+    assert isinstance(errors[1], RuntimeError)
+    assert errors[2] is None
+    assert sorted(db.rows) == sorted([(1, 'user', "first"), (1, 'bot', "second")])
+
+
+def test_reconnects_after_connection_failure(monkeypatch):
+    fake = FakeDatabase(broken_connections=1)
+    monkeypatch.setattr(server, "connect_db", fake.connect)
+    writer = MessageWriter(batch_delay_ms=0, timeout=5)
+
+    writer.write([(1, 'user', "hello")])
+
+    assert fake.rows == [(1, 'user', "hello")]
+    assert fake.connections == 2
+    assert fake.connect_options == {"connection_timeout": 5}
+
+
+def test_failed_commit_is_not_reinserted(db):
+    writer = MessageWriter(batch_delay_ms=200, timeout=5)
+    db.lose_connection_on_commit = True
+    batches = [[(1, 'user', "first")], [(1, 'bot', "second")]]
+
+    errors = write_concurrently(writer, batches)
+
+    assert all(isinstance(e, CommitOutcomeUnknown) for e in errors)
+    assert sorted(db.rows) == sorted([(1, 'user', "first"), (1, 'bot', "second")])
+
+
+def test_timed_out_queued_write_is_never_committed(db):
+    writer = MessageWriter(batch_delay_ms=0, timeout=5)
+    release = threading.Event()
+    flushing = threading.Event()
+
+    def block_first_flush(rows):
+        if rows[0][2] == "blocker":
+            flushing.set()
+            release.wait(5)
+
+    db.before_execute = block_first_flush
+    blocker = threading.Thread(target=writer.write, args=([(1, 'user', "blocker")],))
+    blocker.start()
+    assert flushing.wait(5)
+
+    writer.timeout = 0.05
+    with pytest.raises(TimeoutError):
+        writer.write([(1, 'user', "late")])
+
+    release.set()
+    blocker.join(5)
+    writer.timeout = 5
+    writer.write([(1, 'user', "after")])
+
+    assert (1, 'user', "late") not in db.rows
+    assert db.rows == [(1, 'user', "blocker"), (1, 'user', "after")]
+
+
+def test_write_already_flushing_waits_instead_of_timing_out(db):
+    writer = MessageWriter(batch_delay_ms=0, timeout=0.3)
+    db.before_execute = lambda rows: threading.Event().wait(0.45)
+
+    writer.write([(1, 'user', "slow")])
+
+    assert db.rows == [(1, 'user', "slow")]
+
+
+def test_stalled_flush_gives_up_with_unknown_outcome(db):
+    writer = MessageWriter(batch_delay_ms=0, timeout=0.05)
+    release = threading.Event()
+    db.before_execute = lambda rows: release.wait(5)
+
+    try:
+        with pytest.raises(CommitOutcomeUnknown):
+            writer.write([(1, 'user', "stuck")])
+    finally:
+        release.set()